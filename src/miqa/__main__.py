@@ -0,0 +1,17 @@
+"""
+Command line entry point, e.g. ``uv run -m miqa geo crawl``.
+"""
+
+import typer
+
+from miqa import arrayexpress, geo
+from miqa.utils import setup_logging
+
+app = typer.Typer(help='DNA methylation microarray sample crawlers')
+app.add_typer(geo.app, name='geo')
+app.add_typer(arrayexpress.app, name='arrayexpress')
+
+
+if __name__ == '__main__':
+    setup_logging()
+    app()
@@ -2,11 +2,13 @@
 ArrayExpress (by BioStudies) repository data retrieval utilities.
 """
 
+import asyncio
 import csv
 import json
 import logging
 import re
 from dataclasses import dataclass
+from functools import lru_cache
 from io import StringIO
 from typing import Any, Iterator, Self
 
@@ -15,7 +17,7 @@ import psycopg
 import toolz as tz
 import typer
 
-from miqa import db
+from miqa import db, http
 from miqa.error import MiqaError
 
 
@@ -36,7 +38,7 @@ def list_studies(page_size: int = 100) -> Iterator[dict]:
     """Return all studies matching methylation-by-array + idat filter, paginating as needed."""
     page = 1
     while True:
-        res = httpx.get(
+        res = http.get(
             SEARCH_BASE,
             params={
                 'facet.study_type': 'methylation profiling by array',
@@ -55,7 +57,7 @@ def list_studies(page_size: int = 100) -> Iterator[dict]:
         page += 1
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class StudyLinks:
     root: str
     idf: str
@@ -72,7 +74,11 @@ class StudyLinks:
 
     @classmethod
     def from_accession(cls, accession: str) -> Self:
-        study = httpx.get(f'{STUDY_BASE}/{accession}/info').json()
+        return cls.from_info(accession, http.get(f'{STUDY_BASE}/{accession}/info').json())
+
+    @classmethod
+    def from_info(cls, accession: str, study: dict) -> Self:
+        """Build the links from an already fetched study ``/info`` response."""
         return cls(
             root=study['httpLink'],
             idf=study['httpLink'] + f'/Files/{accession}.idf.txt',
@@ -82,22 +88,55 @@ class StudyLinks:
         )
 
 
+async def fetch_study_files_async(
+    accessions: list[str],
+    concurrency: int = 8,
+    client: httpx.AsyncClient | None = None,
+) -> list[tuple[str, tuple[str, str] | Exception]]:
+    """
+    Fetch the IDF and SDRF text of multiple studies in parallel.
+
+    Returns a list of (accession, result) pairs where result is either an
+    (idf_text, sdrf_text) tuple or an Exception if any of the requests failed.
+    Pass *client* to reuse one connection pool across calls on the same event loop.
+    """
+    if client is None:
+        async with http.async_client() as own_client:
+            return await fetch_study_files_async(accessions, concurrency, own_client)
+
+    sem = asyncio.Semaphore(concurrency)
+
+    async def fetch_one(accession: str) -> tuple[str, str]:
+        async with sem:
+            info = await http.get_json(client, f'{STUDY_BASE}/{accession}/info')
+            links = StudyLinks.from_info(accession, info)
+            idf_text, sdrf_text = await asyncio.gather(
+                http.get_text(client, links.idf),
+                http.get_text(client, links.sdrf),
+            )
+            return idf_text, sdrf_text
+
+    results = await asyncio.gather(
+        *[fetch_one(acc) for acc in accessions],
+        return_exceptions=True,
+    )
+    return list(zip(accessions, results))
+
+
 def _attrs_to_dict(attrs: list[dict]) -> dict:
     return {attr['name']: attr['value'] for attr in attrs if 'name' in attr and 'value' in attr}
 
 
-def _parse_entity(node: dict) -> dict:
+def _parse_entity(node: dict) -> tuple[str, dict]:
+    """Return the (key, attributes) entry of a Page-TAB node, keyed by accno if it has one."""
+    attrs = _attrs_to_dict(node.get('attributes', ()))
     if 'accno' in node:
-        val = _attrs_to_dict(node.get('attributes', {}))
-        val['node_type'] = node['type']
-        return {node['accno']: val}
-    else:
-        return {
-            node['type']: _attrs_to_dict(node.get('attributes', {})),
-        }
+        attrs['node_type'] = node['type']
+        return node['accno'], attrs
+    return node['type'], attrs
 
 
-def _walk_page_tab_json(node) -> Iterator[dict]:
+def _walk_page_tab_json(node) -> Iterator[tuple[str, dict]]:
     if isinstance(node, list):
         for n in node:
             yield from _walk_page_tab_json(n)
@@ -112,11 +151,11 @@ def _walk_page_tab_json(node) -> Iterator[dict]:
 
 def get_study_metadata(accession: str) -> dict:
     """Parse a Page-TAB json into usable info."""
-    resp = httpx.get(f'{STUDY_BASE}/{accession}').json()
+    resp = http.get(f'{STUDY_BASE}/{accession}').json()
     info = _attrs_to_dict(resp.get('attributes', []))
 
     # Walk the Page-tab JSON and extract all entities to top level, keyed by ID
-    entities = tz.merge(*list(_walk_page_tab_json(resp['section'])))
+    entities = dict(_walk_page_tab_json(resp['section']))
     return info | {'entities': entities}
 
 
@@ -267,16 +306,19 @@ _GENDER_MAP = {
 _VALUE_PREFIXES = frozenset(['characteristics', 'factor value'])
 
 
+@lru_cache(maxsize=4096)
 def _parse_sdrf_col(col: str) -> tuple[str, str | None]:
     """Return (prefix, attribute) for an SDRF column name.
 
     Handles optional space before '[]': 'Characteristics [age]' and
     'Characteristics[age]' are both parsed as ('characteristics', 'age').
+    Cached, since every row of a study repeats the same header.
     """
-    m = re.match(r'^(.+?)\s*\[(.+)\]$', col.strip())
-    if m:
-        return m.group(1).strip().lower(), m.group(2).strip().lower()
-    return col.strip().lower(), None
+    col = col.strip()
+    prefix, bracket, rest = col.partition('[')
+    if bracket and prefix and len(rest) > 1 and rest.endswith(']'):
+        return prefix.strip().lower(), rest[:-1].strip().lower()
+    return col.lower(), None
 
 
 def extract_sdrf_metadata(row: dict) -> dict[str, Any]:
@@ -292,15 +334,16 @@ def extract_sdrf_metadata(row: dict) -> dict[str, Any]:
     structured: dict[str, Any] = {}
     extras: dict[str, Any] = {}
 
+    cells = [(*_parse_sdrf_col(col), val) for col, val in row.items()]
+
     # Collect units first (Unit[attr] columns follow their value columns)
-    units: dict[str, str] = {}
-    for col, val in row.items():
-        prefix, attr = _parse_sdrf_col(col)
-        if prefix == 'unit' and attr and val and val.strip():
-            units[attr] = val.strip()
-
-    for col, val in row.items():
-        prefix, attr = _parse_sdrf_col(col)
+    units = {
+        attr: val.strip()
+        for prefix, attr, val in cells
+        if prefix == 'unit' and attr and val and val.strip()
+    }
+
+    for prefix, attr, val in cells:
         if prefix not in _VALUE_PREFIXES or not attr or not val or not val.strip():
             continue
 
@@ -333,6 +376,18 @@ def parse_sdrf(text: str) -> list[dict]:
 # --------------------
 
 
+_UPSERT_SAMPLE_SQL = """
+    INSERT INTO sample (
+        repository_id, repository_sample_id, repository_series_id,
+        source_metadata, normalised_metadata
+    ) VALUES ('ae', %s, %s, %s, NULL)
+    ON CONFLICT (repository_id, repository_sample_id) DO UPDATE
+    SET source_metadata = EXCLUDED.source_metadata,
+        repository_series_id = EXCLUDED.repository_series_id
+    RETURNING id
+"""
+
+
 def upsert_sample(
     sample_id: str,
     series_id: str,
@@ -340,25 +395,85 @@ def upsert_sample(
     conn: psycopg.Connection,
 ) -> int:
     with conn.cursor() as cur:
-        cur.execute(
-            """
-            INSERT INTO sample (
-                repository_id, repository_sample_id, repository_series_id,
-                source_metadata, normalised_metadata
-            ) VALUES ('ae', %s, %s, %s, NULL)
-            ON CONFLICT (repository_id, repository_sample_id) DO UPDATE
-            SET source_metadata = EXCLUDED.source_metadata,
-                repository_series_id = EXCLUDED.repository_series_id
-            RETURNING id
-            """,
-            (sample_id, series_id, json.dumps(source_metadata)),
-        )
+        cur.execute(_UPSERT_SAMPLE_SQL, (sample_id, series_id, json.dumps(source_metadata)))
         if (res := cur.fetchone()) is not None:
             return res[0]
 
         raise db.DBError('Could not upsert row')
 
 
+def upsert_samples(
+    rows: list[tuple[str, str, dict]],
+    conn: psycopg.Connection,
+) -> list[int]:
+    """
+    Upsert (sample_id, series_id, source_metadata) rows as a single pipelined batch.
+
+    Returns the sample ids in the same order as *rows*. The batch runs in one
+    transaction, so either every row is stored or none is.
+    """
+    with conn.transaction(), conn.cursor() as cur:
+        cur.executemany(
+            _UPSERT_SAMPLE_SQL,
+            [(sample_id, series_id, json.dumps(meta)) for sample_id, series_id, meta in rows],
+            returning=True,
+        )
+        return db.returned_ids(cur)
+
+
+def store_study(
+    accession: str,
+    idf_text: str,
+    sdrf_text: str,
+    conn: psycopg.Connection,
+    cnt: int,
+    seen: set[str],
+) -> int:
+    """
+    Upsert the samples of one study that are not in *seen*. Returns the updated sample
+    count. Stored samples are added to *seen*.
+    """
+    study_metadata = parse_idf(idf_text)
+
+    rows = []
+    # The SDRF repeats a source once per channel, only its first row is stored
+    batched = set()
+    for raw_row in csv.DictReader(StringIO(sdrf_text), delimiter='\t'):
+        source_name = raw_row.get('Source Name', '').strip()
+        if not source_name:
+            continue
+
+        # Prefix with accession to ensure global uniqueness across studies.
+        sample_key = f'{accession}/{source_name}'
+        if sample_key in seen or sample_key in batched:
+            continue
+
+        batched.add(sample_key)
+        rows.append((sample_key, accession, study_metadata | extract_sdrf_metadata(raw_row)))
+
+    if not rows:
+        return cnt
+
+    try:
+        stored = list(zip(rows, upsert_samples(rows, conn)))
+    except Exception:
+        # Retry one by one so a single bad row doesn't drop the whole study
+        logger.exception(f'Batch insert failed for {accession}, inserting samples one by one')
+        stored = []
+        for row in rows:
+            try:
+                stored.append((row, upsert_sample(*row, conn)))
+            except Exception:
+                logger.exception(f'Failed to insert sample_key={row[0]!r}')
+
+    for (sample_key, _, _), db_id in stored:
+        logger.info(f'[{cnt}] {sample_key} → db_id={db_id}')
+        seen.add(sample_key)
+        cnt += 1
+
+    return cnt
+
+
 app = typer.Typer(help='ArrayExpress crawler')
 
 
@@ -368,56 +483,42 @@ def import_one(accession: str = 'E-MTAB-14823'):
 
     # Get simple JSON info
     study_links = StudyLinks.from_accession(accession)
-    pprint(list(csv.DictReader(StringIO(httpx.get(study_links.sdrf).text), delimiter='\t')))
+    pprint(list(csv.DictReader(StringIO(http.get(study_links.sdrf).text), delimiter='\t')))
 
     study_details = get_study_metadata(accession)
     pprint(study_details)
 
-    # print(httpx.get(study_links.idf).text)
-    # print(httpx.get(study_links.sdrf).text)
-    # pprint(parse_sdrf(httpx.get(study_links.sdrf).text))
+    # print(http.get(study_links.idf).text)
+    # print(http.get(study_links.sdrf).text)
+    # pprint(parse_sdrf(http.get(study_links.sdrf).text))
 
 
 @app.command()
-def crawl(skip_seen: bool = True):
-    import miqa.config as config
-
-    conn = psycopg.connect(config.DATABASE_URL, autocommit=True)
+def crawl(skip_seen: bool = True, concurrency: int = 8):
+    conn = db.connect(autocommit=True)
     cnt = 0
+    seen = db.seen_sample_ids(conn, 'ae') if skip_seen else set()
 
-    for study_hit in list_studies():
-        accession = study_hit.get('accession')
-        if not accession:
-            continue
-
+    # One event loop and connection pool for the whole crawl, DB writes stay synchronous.
+    with asyncio.Runner() as runner:
+        client = http.async_client()
         try:
-            links = StudyLinks.from_accession(accession)
-            idf_text = httpx.get(links.idf).text
-            sdrf_text = httpx.get(links.sdrf).text
-        except Exception:
-            logger.exception(f'Failed to fetch study files for {accession}')
-            continue
-
-        study_metadata = parse_idf(idf_text)
-
-        for raw_row in csv.DictReader(StringIO(sdrf_text), delimiter='\t'):
-            source_name = raw_row.get('Source Name', '').strip()
-            if not source_name:
-                continue
-
-            # Prefix with accession to ensure global uniqueness across studies.
-            sample_key = f'{accession}/{source_name}'
-            if skip_seen and db.seen_sample(conn, 'ae', sample_key):
-                continue
-
-            source_metadata = study_metadata | extract_sdrf_metadata(raw_row)
-
-            try:
-                db_id = upsert_sample(sample_key, accession, source_metadata, conn)
-                logger.info(f'[{cnt}] {sample_key} → db_id={db_id}')
-                cnt += 1
-            except Exception:
-                logger.exception(f'Failed to insert {sample_key=}')
+            for study_hits in tz.partition_all(concurrency, list_studies()):
+                accessions = [acc for hit in study_hits if (acc := hit.get('accession'))]
+
+                # Fetch the study files for a batch of studies in parallel, then write
+                # sequentially.
+                results = runner.run(fetch_study_files_async(accessions, concurrency, client))
+
+                for accession, files_or_exc in results:
+                    if isinstance(files_or_exc, Exception):
+                        logger.error(f'Failed to fetch study files {accession}: {files_or_exc}')
+                        continue
+
+                    idf_text, sdrf_text = files_or_exc
+                    cnt = store_study(accession, idf_text, sdrf_text, conn, cnt, seen)
+        finally:
+            runner.run(client.aclose())
 
     logger.info(f'Crawl complete: {cnt} samples inserted/updated')
 
@@ -14,3 +14,17 @@ S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL', '')
 S3_BUCKET = os.environ.get('S3_BUCKET', '')
 S3_KEY = os.environ.get('S3_KEY', '')
 S3_SECRET = os.environ.get('S3_SECRET', '')
+
+# Raises the Entrez rate limit from 3 to 10 requests/s when set
+NCBI_API_KEY = os.environ.get('NCBI_API_KEY', '')
+
+# Contact address sent to Entrez with every request, so NCBI can reach us before blocking
+NCBI_EMAIL = os.environ.get('NCBI_EMAIL', '')
+
+# Directory for the on-disk HTTP response cache; caching is disabled when empty
+HTTP_CACHE_DIR = os.environ.get('HTTP_CACHE_DIR', '')
+
+# Days a cached GEO record (acc.cgi SOFT text, which has no ETag/Last-Modified) is reused for.
+# Entrez search and summary results are cached for http.CACHE_TTL only, they change as GEO grows.
+# A blank value, as in .env.example, means the default.
+HTTP_CACHE_TTL_DAYS = float(os.environ.get('HTTP_CACHE_TTL_DAYS') or '1')
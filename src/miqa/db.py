@@ -2,11 +2,9 @@
 Database helpers — raw SQL via psycopg3, no ORM.
 """
 
-import json
-from typing import Any
-
 import psycopg
 
+from miqa import config
 from miqa.error import MiqaError
 
 
@@ -14,109 +12,72 @@ class DBError(MiqaError):
     pass
 
 
-def seen_sample(
-    conn: psycopg.Connection,
-    repository_id: str,
-    repository_sample_id: str,
-) -> bool:
-    with conn.cursor() as cur:
-        return (
-            cur.execute(
-                """
-                SELECT 1 FROM sample
-                WHERE repository_id = %s AND repository_sample_id = %s
-                """,
-                (
-                    repository_id,
-                    repository_sample_id,
-                ),
-            ).fetchone()
-            is not None
-        )
+def connect(autocommit: bool = False) -> psycopg.Connection:
+    """
+    Open a connection to DATABASE_URL.
 
+    Statements are prepared server-side from their second execution (psycopg defaults
+    to the fifth), since the crawlers repeat the same few queries for every sample.
+    """
+    return psycopg.connect(config.DATABASE_URL, autocommit=autocommit, prepare_threshold=1)
 
-def upsert_sample(
+
+def returned_ids(cur: psycopg.Cursor) -> list[int]:
+    """Collect the id returned by each statement of ``executemany(..., returning=True)``."""
+    ids = [cur.fetchone()[0]]
+    while cur.nextset():
+        ids.append(cur.fetchone()[0])
+    return ids
+
+
+def seen_sample_ids(
     conn: psycopg.Connection,
-    *,
     repository_id: str,
-    repository_sample_id: str,
-    repository_series_id: str | None = None,
-    platform_id: str | None = None,
-    gender: str | None = None,
-    age: str | None = None,
-    tissue: str | None = None,
-    disease: str | None = None,
-    extraction_protocol: str | None = None,
-    extras: dict[str, Any] | None = None,
-) -> int:
+    sample_ids: list[str] | None = None,
+) -> set[str]:
     """
-    Insert a sample row, ignoring conflicts on (repository_id, repository_sample_id).
-    Returns the sample id (new or existing).
+    Return the repository_sample_id of every sample already stored for *repository_id*.
 
-    TODO: Indicate the difference between inserted sample and an upsert?
+    Loaded once at the start of a crawl so that seen samples are skipped with a set
+    lookup, rather than a query per sample. Pass *sample_ids* to only check those.
     """
-
     with conn.cursor() as cur:
-        cur.execute(
-            """
-            INSERT INTO sample (
-                repository_id, repository_sample_id, repository_series_id,
-                platform_id, gender, age, tissue, disease,
-                extraction_protocol, extras
-            ) VALUES (
-                %s, %s, %s, %s, %s::gender, %s, %s, %s, %s, %s
+        if sample_ids is None:
+            cur.execute(
+                'SELECT repository_sample_id FROM sample WHERE repository_id = %s',
+                (repository_id,),
             )
-            ON CONFLICT (repository_id, repository_sample_id) DO NOTHING
-            RETURNING id
-            """,
-            (
-                repository_id,
-                repository_sample_id,
-                repository_series_id,
-                platform_id,
-                gender,
-                age,
-                tissue,
-                disease,
-                extraction_protocol,
-                json.dumps(extras) if extras else None,
-            ),
-        )
-        row = cur.fetchone()
-        if row is not None:
-            return row[0]
-
-        # Row already existed — fetch its id
-        cur.execute(
-            'SELECT id FROM sample WHERE repository_id = %s AND repository_sample_id = %s',
-            (repository_id, repository_sample_id),
-        )
-        row = cur.fetchone()
-        if row is not None:
-            return row[0]
-
-        raise DBError('Could not find row that was expected to exist.')
+        else:
+            cur.execute(
+                'SELECT repository_sample_id FROM sample'
+                ' WHERE repository_id = %s AND repository_sample_id = ANY(%s)',
+                (repository_id, sample_ids),
+            )
+        return {row[0] for row in cur}
 
 
-def insert_idat_file(
+def insert_idat_files(
     conn: psycopg.Connection,
     *,
     sample_id: int,
-    source_url: str,
-    s3_key: str | None = None,
-    channel: str | None = None,
-) -> int:
-    """Insert an idat_file row. Returns the new id."""
+    files: list[tuple[str, str | None]],
+) -> list[int]:
+    """
+    Insert idat_file rows for one sample as a single pipelined batch.
+
+    *files* holds (source_url, channel) pairs. Returns the new ids in the same order.
+    """
     with conn.cursor() as cur:
-        cur.execute(
+        cur.executemany(
             """
-            INSERT INTO idat_file (sample_id, source_url, s3_key, channel)
-            VALUES (%s, %s, %s, %s)
+            INSERT INTO idat_file (sample_id, source_url, channel)
+            VALUES (%s, %s, %s)
             RETURNING id
             """,
-            (sample_id, source_url, s3_key, channel),
+            [(sample_id, source_url, channel) for source_url, channel in files],
+            returning=True,
         )
-        return cur.fetchone()[0]
+        return returned_ids(cur)
 
 
 def mark_idat_uploaded(conn: psycopg.Connection, idat_id: int, s3_key: str) -> None:
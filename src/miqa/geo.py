@@ -21,7 +21,7 @@ import asyncio
 import json
 import logging
 import sys
-import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Iterable
 
@@ -30,8 +30,8 @@ import psycopg
 import typer
 import toolz as tz
 
-from miqa import db, storage
-from miqa.utils import assert_list_str, guess_idat_channel, streamed_download
+from miqa import config, db, http, storage
+from miqa.utils import assert_list_str, guess_idat_channel
 from miqa.error import MiqaError
 
 
@@ -39,6 +39,30 @@ E_UTILS_BASE = 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils'
 GEO_ACCN_BASE = 'https://www.ncbi.nlm.nih.gov/geo/query/acc.cgi'
 GEO_FTP_BASE = 'https://ftp.ncbi.nlm.nih.gov/geo'
 
+# Registered with NCBI as the 'tool' param of every Entrez request
+E_UTILS_TOOL = 'miqa'
+
+# Number of UIDs summarised per eSummary request, the most eSummary returns in one go
+E_SUMMARY_BATCH_SIZE = 500
+
+# NCBI asks for POST rather than GET once a request carries more than this many UIDs
+E_UTILS_MAX_GET_IDS = 200
+
+# eSearch terms longer than this many characters are POSTed, again to stay clear of URL limits
+E_UTILS_MAX_GET_TERM = 1000
+
+# Supplementary files taken to be idats, plain or gzipped as GEO serves them
+IDAT_SUFFIXES = ('.idat', '.idat.gz', '.IDAT', '.IDAT.gz')
+
+# Fetched series waiting to be stored before the crawl stops looking up more
+CRAWL_QUEUE_SIZE = 4
+
+# Number of idat files of one sample downloaded and uploaded at the same time
+IDAT_TRANSFER_WORKERS = 4
+
+# Idats are read from GEO 1 MiB at a time rather than in httpx's small default chunks
+IDAT_CHUNK_SIZE = 1 << 20
+
 logger = logging.getLogger(__spec__.name)
 
 
@@ -59,17 +83,24 @@ class GEODataError(MiqaError):
 # --------------------
 
 
+def _record_cache_extensions() -> dict:
+    """Keep GEO records cached for HTTP_CACHE_TTL_DAYS, they rarely change once public."""
+    return http.cache_ttl(config.HTTP_CACHE_TTL_DAYS * http.SECONDS_PER_DAY)
+
+
 def geo_lookup(accession_id: str, extra_params={}) -> list[dict]:
     """
     Core API access of GEO records.
 
     See 'Construct a URL' section on https://www.ncbi.nlm.nih.gov/geo/info/download.html
-    for details of the query parameters.
+    for details of the query parameters. The response is parsed as it streams in, so large
+    platform records listing every sample are never held in memory as a whole.
     """
     url = GEO_ACCN_BASE
     params = {'acc': accession_id, 'targ': 'self', 'view': 'brief', 'form': 'text'} | extra_params
-    res = httpx.get(url, params=params)
-    return parse_soft_lines(res.iter_lines())
+    with http.stream(url, params=params, extensions=_record_cache_extensions()) as res:
+        res.raise_for_status()
+        return parse_soft_lines(res.iter_lines())
 
 
 def geo_exact_lookup(accession_id: str, *args, **kwargs) -> dict:
@@ -79,42 +110,63 @@ def geo_exact_lookup(accession_id: str, *args, **kwargs) -> dict:
     return res[0]
 
 
+def ncbi_rate_limit() -> int:
+    """Requests per second allowed by NCBI: 10 with an API key, 3 without."""
+    return 10 if config.NCBI_API_KEY else 3
+
+
 async def _geo_lookup_async(
     client: httpx.AsyncClient,
     accession_id: str,
     extra_params: dict = {},
 ) -> list[dict]:
     params = {'acc': accession_id, 'targ': 'self', 'view': 'brief', 'form': 'text'} | extra_params
-    res = await client.get(GEO_ACCN_BASE, params=params)
-    return parse_soft_lines(res.text.splitlines())
+    parser = SoftParser()
+    extensions = _record_cache_extensions()
+    async with client.stream('GET', GEO_ACCN_BASE, params=params, extensions=extensions) as res:
+        res.raise_for_status()
+        async for line in res.aiter_lines():
+            parser.parse_line(line)
+    return parser.finish()
 
 
-async def fetch_samples_async(
-    sample_ids: list[str],
-    concurrency: int = 5,
+def geo_async_client() -> httpx.AsyncClient:
+    """AsyncClient for GEO whose request attempts, retries included, keep to the NCBI limit."""
+    return http.async_client(bucket=http.AsyncTokenBucket(ncbi_rate_limit()))
+
+
+async def fetch_records_async(
+    accession_ids: list[str],
+    concurrency: int = 10,
+    client: httpx.AsyncClient | None = None,
 ) -> list[tuple[str, dict | Exception]]:
     """
-    Fetch multiple GEO sample records in parallel.
+    Fetch multiple GEO records (series or samples) in parallel.
 
-    Returns a list of (sample_id, result) pairs where result is either a parsed
-    sample dict or an Exception if the request failed.
+    Returns a list of (accession_id, result) pairs where result is either a parsed
+    record dict or an Exception if the request failed.
+
+    Pass a *client* from :func:`geo_async_client` to share one connection pool and one
+    NCBI rate limit across calls made on the same event loop.
     """
+    if client is None:
+        async with geo_async_client() as own_client:
+            return await fetch_records_async(accession_ids, concurrency, own_client)
+
     sem = asyncio.Semaphore(concurrency)
 
-    async def fetch_one(client: httpx.AsyncClient, sample_id: str):
+    async def fetch_one(accession_id: str):
         async with sem:
-            records = await _geo_lookup_async(client, sample_id)
+            records = await _geo_lookup_async(client, accession_id)
             if len(records) != 1:
-                raise ValueError(f'Expected 1 record for {sample_id}, got {len(records)}')
+                raise ValueError(f'Expected 1 record for {accession_id}, got {len(records)}')
             return records[0]
 
-    async with httpx.AsyncClient() as client:
-        results = await asyncio.gather(
-            *[fetch_one(client, sid) for sid in sample_ids],
-            return_exceptions=True,
-        )
-
-    return list(zip(sample_ids, results))
+    results = await asyncio.gather(
+        *[fetch_one(aid) for aid in accession_ids],
+        return_exceptions=True,
+    )
+    return list(zip(accession_ids, results))
 
 
 class SoftParser:
@@ -126,45 +178,68 @@ class SoftParser:
 
     def __init__(self):
         self.parsed = []
-        self.current = {}
+        # Header fields of the current entity, None until the first '^' line
+        self.current: dict | None = None
+        # Values of the current entity's attributes, collapsed into self.current on flush
+        self._attrs: dict[str, list[str]] = {}
+        # Offset of the attribute name in a '!' line, past '!' and the '<entity_type>_' prefix
+        self._attr_start = 1
+
+    def _flush(self):
+        """Move the current entity, if any, onto the parsed list."""
+        if self.current is not None or self._attrs:
+            entity = {} if self.current is None else self.current
+            for attr, vals in self._attrs.items():
+                entity[attr] = vals[0] if len(vals) == 1 else vals
+            self.parsed.append(entity)
+        self.current = None
+        # Cleared in place, parse_lines holds on to the dict across entities
+        self._attrs.clear()
 
     def parse_line(self, line):
-        first_char = line[0]
-        # New entity identified
-        if first_char == '^':
-            if len(self.current) > 0:
-                self.parsed.append(self.current)
-                self.current = {}
-            entity_header = line[1:].strip().split(' = ')
-            self.current['entity_type'] = entity_header[0]
-            self.current['entity_id'] = entity_header[1]
-
+        first_char = line[:1]
         # Continuation of attributes for current entity
-        elif first_char == '!':
-            attr, _, val = line[1:].strip().partition(' = ')
-            if val.strip() == '':
+        if first_char == '!':
+            eq = line.find(' = ', 1)
+            if eq < 0:
                 return
+            val = line[eq + 3 :].rstrip()
+            if not val:
+                return
+            self._attrs.setdefault(line[self._attr_start : eq], []).append(val)
 
-            attr_prefix_len = len(self.current['entity_type']) + 1
-            attr = attr[attr_prefix_len:]
-            if attr in self.current:
-                if isinstance(self.current[attr], list):
-                    self.current[attr].append(val)
-                else:
-                    self.current[attr] = [self.current[attr], val]
-            else:
-                self.current[attr] = val
+        # New entity identified
+        elif first_char == '^':
+            self._flush()
+            entity_type, _, entity_id = line[1:].strip().partition(' = ')
+            self.current = {'entity_type': entity_type, 'entity_id': entity_id}
+            self._attr_start = len(entity_type) + 2
 
     def parse_lines(self, lines):
-        for line in lines:
-            try:
-                self.parse_line(line)
-            except Exception as e:
-                print(line, file=sys.stderr)
-                raise e
-        if len(self.current) > 0:
-            self.parsed.append(self.current)
+        # Attribute lines make up nearly all of a record, so they are handled inline with
+        # the parser state bound to locals. Anything else goes through parse_line, after
+        # which the attribute name offset is re-read for the new entity.
+        add_attr = self._attrs.setdefault
+        attr_start = self._attr_start
+        line = None
+        try:
+            for line in lines:
+                if line[:1] == '!':
+                    eq = line.find(' = ', 1)
+                    if eq >= 0 and (val := line[eq + 3 :].rstrip()):
+                        add_attr(line[attr_start:eq], []).append(val)
+                else:
+                    self.parse_line(line)
+                    attr_start = self._attr_start
+        except Exception as e:
+            print(line, file=sys.stderr)
+            raise e
+
+        return self.finish()
 
+    def finish(self) -> list[dict]:
+        """Complete the last entity and return all parsed entities."""
+        self._flush()
         return self.parsed
 
 
@@ -178,10 +253,26 @@ def parse_soft_lines(lines: Iterable[str]) -> list[dict]:
 # --------------------
 
 
+def _entrez_params(params: dict) -> dict:
+    """
+    Identify the crawler in Entrez query params, as NCBI's usage policy asks.
+
+    Adds the tool name, plus the contact email and API key when they are configured.
+    """
+    params = params | {'tool': E_UTILS_TOOL}
+    if config.NCBI_EMAIL:
+        params['email'] = config.NCBI_EMAIL
+    if config.NCBI_API_KEY:
+        params['api_key'] = config.NCBI_API_KEY
+    return params
+
+
 def e_search(**extra_params):
     """
     Query the Entrez eSearch program.
 
+    Terms longer than E_UTILS_MAX_GET_TERM are POSTed rather than sent in the query string.
+
     See the following links for docs on the endpoint.
     - https://www.ncbi.nlm.nih.gov/geo/info/qqtutorial.html
     - https://www.ncbi.nlm.nih.gov/geo/info/geo_paccess.html
@@ -192,7 +283,11 @@ def e_search(**extra_params):
         'retMax': 10000,
         'retmode': 'json',
     } | extra_params
-    res = httpx.get(url, params=params)
+    params = _entrez_params(params)
+    if len(params.get('term', '')) > E_UTILS_MAX_GET_TERM:
+        res = http.post(url, data=params)
+    else:
+        res = http.get(url, params=params)
 
     # Check if the request was successful
     if res.status_code != 200:
@@ -204,27 +299,44 @@ def e_search(**extra_params):
     if 'esearchresult' not in data:
         raise GEODataError(f'Data seems malformed. {data}')
 
-    return data['esearchresult']
+    result = data['esearchresult']
+    if 'ERROR' in result or 'idlist' not in result:
+        raise GEODataError(f'eSearch failed: {result.get("ERROR", result)}')
+
+    return result
 
 
-def e_search_all(**extra_params):
+def e_search_all(page_size: int = 500, **extra_params):
     """
     Paginate through results of a query on the Entrez eSearch program.
+
+    Every page re-runs the query with its own retstart rather than reading back an Entrez
+    history session: the crawl can take hours between pages, and sessions expire. Paging
+    stops once the reported count is reached.
     """
-    res = e_search(**extra_params)
-    while (n := len(res['idlist'])) > 0:
+    retstart = 0
+    while True:
+        res = e_search(**extra_params, retstart=retstart, retMax=page_size)
         yield from res['idlist']
-        res = e_search(**extra_params, retstart=int(res['retstart']) + n)
+        retstart += len(res['idlist'])
+        if not res['idlist'] or retstart >= int(res['count']):
+            break
 
 
-def e_summary(id: int | str) -> dict:
+def e_summary(ids: Iterable[int | str]) -> dict:
+    """
+    Query the Entrez eSummary program for a batch of UIDs in one request.
+
+    Batches larger than E_UTILS_MAX_GET_IDS are POSTed rather than sent in the query
+    string, so they don't run into URL length limits.
+    """
     url = E_UTILS_BASE + '/esummary.fcgi'
-    params = {
-        'db': 'gds',
-        'id': id,
-        'retmode': 'json',
-    }
-    res = httpx.get(url, params=params)
+    ids = [str(i) for i in ids]
+    params = _entrez_params({'db': 'gds', 'id': ','.join(ids), 'retmode': 'json'})
+    if len(ids) > E_UTILS_MAX_GET_IDS:
+        res = http.post(url, data=params)
+    else:
+        res = http.get(url, params=params)
 
     if res.status_code != 200:
         raise RuntimeError(f'Request for summary failed with status: {res.status_code}')
@@ -232,6 +344,21 @@ def e_summary(id: int | str) -> dict:
     return res.json()
 
 
+def e_summary_all(
+    ids: Iterable[int | str], batch_size: int = E_SUMMARY_BATCH_SIZE
+) -> Iterable[dict]:
+    """
+    Summarise any number of UIDs with the Entrez eSummary program.
+
+    UIDs are requested *batch_size* at a time, and the records are yielded one by one in
+    the order of *ids*.
+    """
+    for batch in tz.partition_all(batch_size, map(str, ids)):
+        res = e_summary(batch)['result']
+        for uid in batch:
+            yield res[uid]
+
+
 platforms = ['GPL13534', 'GPL21145', 'GPL16304']
 
 series_with_idat_search_term = ' AND '.join(
@@ -239,16 +366,27 @@ series_with_idat_search_term = ' AND '.join(
 )
 
 
+def geo_series_summary_iter() -> Iterable[dict]:
+    """Return an iterator of the Entrez eSummary records of GEO series with idats."""
+    return e_summary_all(e_search_all(term=series_with_idat_search_term))
+
+
 def geo_series_id_iter() -> Iterable[str]:
     """Return an iterator of GEO series IDs."""
-    entrez_ids = e_search_all(term=series_with_idat_search_term)
-    # TODO: eSummary supports fetching more than 1 ID at a time. We can save lots of
-    # network calls if we do a batched query.
-    for eids in tz.partition_all(100, entrez_ids):
-        res = e_summary(','.join(eids))['result']
-        for eid in eids:
-            # Look into entrez's record for corresponding GEO accession ID
-            yield res[eid]['accession']
+    for summary in geo_series_summary_iter():
+        # Look into entrez's record for corresponding GEO accession ID
+        yield summary['accession']
+
+
+def has_unseen_samples(summary: dict, seen: set[str]) -> bool:
+    """
+    Whether the eSummary record of a series lists any sample not in *seen*.
+
+    A series whose summary lists no samples is assumed to have unseen ones, so it is
+    still looked up.
+    """
+    samples = summary.get('samples')
+    return not samples or any(s['accession'] not in seen for s in samples)
 
 
 # --------------------
@@ -256,6 +394,17 @@ def geo_series_id_iter() -> Iterable[str]:
 # --------------------
 
 
+def series_sample_ids(series: dict) -> list[str]:
+    """
+    The sample accessions of a parsed series record.
+
+    The SOFT parser collapses single-valued attributes, so a series of one sample has its
+    sample_id as a plain string rather than a list.
+    """
+    sample_ids = series.get('sample_id', [])
+    return [sample_ids] if isinstance(sample_ids, str) else sample_ids
+
+
 def find_idat_files(sample: dict) -> list[str] | None:
     """Extract the idat file FTP paths of the given sample."""
     series_id = sample['series_id']
@@ -268,7 +417,7 @@ def find_idat_files(sample: dict) -> list[str] | None:
 
     # Ensure there are idat(s)
     assert_list_str(supp)
-    idat_files = [f for f in supp if '.idat' in f.lower()]
+    idat_files = [f for f in supp if f.endswith(IDAT_SUFFIXES)]
     if not idat_files:
         logger.debug(f'No IDAT files for {series_id=}')
         return
@@ -301,29 +450,33 @@ def lift_characteristics(sample: dict) -> dict:
 # --------------------
 
 
+_UPSERT_SAMPLE_SQL = """
+    INSERT INTO sample (
+        repository_id, repository_sample_id, repository_series_id,
+        platform_id, source_metadata, normalised_metadata
+    ) VALUES (
+        'geo', %s, %s, %s, %s, %s
+    )
+    ON CONFLICT (repository_id, repository_sample_id) DO UPDATE
+    SET source_metadata = EXCLUDED.source_metadata,
+        normalised_metadata = EXCLUDED.normalised_metadata
+    RETURNING id;
+"""
+
+
+def _upsert_sample_params(sample: dict, series: dict) -> tuple:
+    return (
+        sample['entity_id'],
+        series['entity_id'],
+        sample['platform_id'],
+        json.dumps(join_series_sample_attrs(lift_characteristics(sample), series)),
+        None,  # TODO: Do we normalise metadata right away?
+    )
+
+
 def upsert_sample(sample, series, conn):
     with conn.cursor() as cur:
-        cur.execute(
-            """
-            INSERT INTO sample (
-                repository_id, repository_sample_id, repository_series_id,
-                platform_id, source_metadata, normalised_metadata
-            ) VALUES (
-                'geo', %s, %s, %s, %s, %s
-            )
-            ON CONFLICT (repository_id, repository_sample_id) DO UPDATE
-            SET source_metadata = EXCLUDED.source_metadata,
-                normalised_metadata = EXCLUDED.normalised_metadata
-            RETURNING id;
-            """,
-            (
-                sample['entity_id'],
-                series['entity_id'],
-                sample['platform_id'],
-                json.dumps(join_series_sample_attrs(lift_characteristics(sample), series)),
-                None,  # TODO: Do we normalise metadata right away?
-            ),
-        )
+        cur.execute(_UPSERT_SAMPLE_SQL, _upsert_sample_params(sample, series))
         row = cur.fetchone()
         if row is not None:
             return row[0]
@@ -331,38 +484,61 @@ def upsert_sample(sample, series, conn):
         raise db.DBError('Could not upsert row')
 
 
-def download_idats(sample: dict, sample_db_id: int, conn: psycopg.Connection) -> bool:
-    if (idat_files := find_idat_files(sample)) is None:
-        return False
+def upsert_samples(samples: list[dict], series: dict, conn: psycopg.Connection) -> list[int]:
+    """
+    Upsert the samples of one series as a single pipelined batch.
 
-    # Insert each idat as DB record and download to storage
-    for fpath in idat_files:
-        # Replace ftp:// with https://
-        # We are using HTTP to fetch the files instead of FTP because their FTP
-        # server doesn't seem to work
-        fpath = 'https' + fpath[3:] if fpath.startswith('ftp') else fpath
-        filename = Path(fpath).name
-        s3_key = f'geo/{sample["entity_id"]}/{filename}'
-
-        idat_id = db.insert_idat_file(
-            conn,
-            sample_id=sample_db_id,
-            source_url=fpath,
-            channel=guess_idat_channel(filename),
+    Returns the sample ids in the same order as *samples*. The batch runs in one
+    transaction, so either every sample is stored or none is.
+    """
+    with conn.transaction(), conn.cursor() as cur:
+        cur.executemany(
+            _UPSERT_SAMPLE_SQL,
+            [_upsert_sample_params(sample, series) for sample in samples],
+            returning=True,
         )
+        return db.returned_ids(cur)
 
-        # Download file to tmp local storage, then upload to S3
-        with tempfile.TemporaryDirectory() as tmpdir:
-            local_path = Path(tmpdir) / filename
-            streamed_download(fpath, str(local_path))
-            storage.upload_file(local_path, s3_key)
 
-            # TODO perhaps we should also process the idat file(s) rightaway, and S3
-            # serves more as a short term mirror such that we can have easy access
-            # to the file if inspections are needed? (like 30 retention)
+def download_idats(sample: dict, sample_db_id: int, conn: psycopg.Connection) -> bool:
+    if (idat_files := find_idat_files(sample)) is None:
+        return False
 
-        db.mark_idat_uploaded(conn, idat_id, s3_key)
-        logger.info(f'Uploaded {s3_key}')
+    # Replace ftp:// with https://
+    # We are using HTTP to fetch the files instead of FTP because their FTP
+    # server doesn't seem to work
+    urls = ['https' + f[3:] if f.startswith('ftp') else f for f in idat_files]
+
+    # Insert all idats as DB records in one batch, then download each to storage
+    idat_ids = db.insert_idat_files(
+        conn,
+        sample_id=sample_db_id,
+        files=[(url, guess_idat_channel(Path(url).name)) for url in urls],
+    )
+
+    def transfer(fpath: str) -> str:
+        """Stream one idat file from GEO straight into S3, without a local copy."""
+        s3_key = f'geo/{sample["entity_id"]}/{Path(fpath).name}'
+        # Uploads only become visible once complete, so an existing key was fully
+        # transferred by an earlier run that stopped before recording it
+        if storage.object_exists(s3_key):
+            logger.debug(f'Skipping {s3_key}, already in storage')
+            return s3_key
+        with http.stream_file(fpath) as res:
+            res.raise_for_status()
+            storage.stream_to_s3(res.iter_bytes(IDAT_CHUNK_SIZE), s3_key)
+
+        # TODO perhaps we should also process the idat file(s) rightaway, and S3
+        # serves more as a short term mirror such that we can have easy access
+        # to the file if inspections are needed? (like 30 retention)
+        return s3_key
+
+    # Transfer the files of the sample concurrently. The DB connection isn't shared with
+    # the workers, uploads are recorded from this thread as they complete.
+    with ThreadPoolExecutor(max_workers=IDAT_TRANSFER_WORKERS) as pool:
+        for idat_id, s3_key in zip(idat_ids, pool.map(transfer, urls)):
+            db.mark_idat_uploaded(conn, idat_id, s3_key)
+            logger.info(f'Uploaded {s3_key}')
     return True
 
 
@@ -375,24 +551,18 @@ app = typer.Typer(help='GEO crawler')
 
 
 @app.command()
-def import_one(series_id: str):
-    import miqa.config as cfg
-
-    conn = psycopg.connect(cfg.DATABASE_URL, autocommit=True)
+def import_one(series_id: str, concurrency: int = 10):
+    conn = db.connect(autocommit=True)
     series = geo_exact_lookup(series_id)
 
-    for sample_id in series['sample_id']:
-        if db.seen_sample(conn, 'geo', sample_id):
-            logger.debug('Seen sample')
-            continue
+    sample_ids = series_sample_ids(series)
+    # Only this series' samples are checked, rather than loading every seen GEO sample
+    seen = db.seen_sample_ids(conn, 'geo', sample_ids)
+    unseen_ids = [sid for sid in sample_ids if sid not in seen]
+    logger.debug(f'{len(sample_ids) - len(unseen_ids)} samples already seen')
 
-        sample = geo_exact_lookup(sample_id)
-        db_id = upsert_sample(sample, series, conn)
-        logger.info(f'{sample_id} inserted as {db_id=}')
-        if download_idats(sample, db_id, conn):
-            logger.info(f'Downloaded {sample_id=} idat files')
-        else:
-            logger.info(f'Failed to download {sample_id=} idat files')
+    results = asyncio.run(fetch_records_async(unseen_ids, concurrency))
+    store_series(series, results, conn, 1, seen, download_idat=True)
 
 
 @app.command()
@@ -408,56 +578,145 @@ def show_raw(
     pprint(res_sample)
 
 
-@app.command()
-def crawl(
-    skip_seen: bool = True,
-    download_idat: bool = False,
-    concurrency: int = 10,
-):
-    import miqa.config as config
-
-    conn = psycopg.connect(config.DATABASE_URL, autocommit=True)
-    cnt = 1
-    for series_id in geo_series_id_iter():
-        try:
-            series = geo_exact_lookup(series_id)
-        except Exception:
-            logger.exception(f'Failed to lookup {series_id=}')
-            continue
-
-        unseen_ids = [
-            sid
-            for sid in series['sample_id']
-            if not (skip_seen and db.seen_sample(conn, 'geo', sid))
-        ]
-        logger.debug(f'{series_id=}: {len(series["sample_id"])} samples, {len(unseen_ids)} unseen')
-
-        if not unseen_ids:
+def store_series(
+    series: dict,
+    results: list[tuple[str, dict | Exception]],
+    conn: psycopg.Connection,
+    cnt: int,
+    seen: set[str],
+    download_idat: bool,
+) -> int:
+    """
+    Store the fetched samples of one series, see :func:`fetch_records_async` for *results*.
+    Returns the updated sample count. Stored samples are added to *seen*.
+    """
+    series_id = series['entity_id']
+    samples = []
+    for sample_id, sample_or_exc in results:
+        if isinstance(sample_or_exc, Exception):
+            logger.error(f'Failed to fetch {sample_id}: {sample_or_exc}')
             continue
-
-        # Fetch all unseen samples for this series in parallel, then write sequentially.
-        results = asyncio.run(fetch_samples_async(unseen_ids, concurrency=concurrency))
-
-        for sample_id, sample_or_exc in results:
-            if isinstance(sample_or_exc, Exception):
-                logger.error(f'Failed to fetch {sample_id}: {sample_or_exc}')
-                continue
-
+        samples.append(sample_or_exc)
+
+    if not samples:
+        return cnt
+
+    try:
+        stored = list(zip(samples, upsert_samples(samples, series, conn)))
+    except Exception:
+        # Retry one by one so a single bad sample doesn't drop the whole series
+        logger.exception(f'Batch insert failed for {series_id=}, inserting samples one by one')
+        stored = []
+        for sample in samples:
+            sample_id = sample['entity_id']
             try:
-                db_id = upsert_sample(sample_or_exc, series, conn)
-                logger.info(f'{cnt=} {sample_id} inserted as {db_id=}')
-                cnt += 1
+                stored.append((sample, upsert_sample(sample, series, conn)))
             except psycopg.errors.ForeignKeyViolation:
                 logger.error(f'Failed to insert sample {sample_id=} with uncatalogued attribute')
             except Exception:
                 logger.exception(f'Failed to insert {sample_id=}')
+
+    for sample, db_id in stored:
+        sample_id = sample['entity_id']
+        logger.info(f'{cnt=} {sample_id} inserted as {db_id=}')
+        seen.add(sample_id)
+        cnt += 1
+
+        # Optionally download idat files as well
+        if download_idat:
+            if download_idats(sample, db_id, conn):
+                logger.info(f'Downloaded {sample_id=} idat files')
             else:
-                # Optionally download idat files as well
-                if download_idat:
-                    if download_idats(sample_or_exc, db_id, conn):
-                        logger.info(f'Downloaded {sample_id=} idat files')
-                    else:
-                        logger.info(f'Failed to download {sample_id=} idat files')
+                logger.info(f'Failed to download {sample_id=} idat files')
+
+    return cnt
+
+
+async def crawl_async(
+    conn: psycopg.Connection,
+    seen: set[str],
+    download_idat: bool,
+    concurrency: int,
+) -> int:
+    """
+    Crawl every GEO series with idats as a two stage pipeline. Returns the sample count.
+
+    A producer looks up series and their unseen samples on one shared client, and hands
+    each fetched series to a consumer over a bounded queue. The consumer stores them in a
+    worker thread, so lookups for the next series carry on while the DB writes and idat
+    transfers of the previous ones run. The queue bound keeps the producer from running
+    too far ahead when storage is the bottleneck.
+    """
+    queue: asyncio.Queue[tuple[dict, list] | None] = asyncio.Queue(maxsize=CRAWL_QUEUE_SIZE)
+
+    async with geo_async_client() as client:
+
+        async def fetch(accession_ids: list[str]) -> list[tuple[str, dict | Exception]]:
+            return await fetch_records_async(accession_ids, concurrency, client)
+
+        # Samples handed to the consumer but possibly not stored yet. A SuperSeries and its
+        # SubSeries list the same samples, which must be fetched and stored only once.
+        queued: set[str] = set()
+
+        async def produce():
+            # Series whose eSummary lists only seen samples are skipped without a lookup
+            unseen_series = (
+                summary['accession']
+                for summary in geo_series_summary_iter()
+                if has_unseen_samples(summary, seen)
+            )
+            # The eSearch/eSummary iterator is synchronous, step through it off the loop
+            batches = tz.partition_all(concurrency, unseen_series)
+            while series_ids := await asyncio.to_thread(next, batches, None):
+                # Look up a batch of series in parallel, then fetch their samples in order.
+                for series_id, series in await fetch(list(series_ids)):
+                    if isinstance(series, Exception):
+                        logger.error(f'Failed to lookup {series_id=}: {series}')
+                        continue
+
+                    sample_ids = series_sample_ids(series)
+                    unseen_ids = [
+                        sid for sid in sample_ids if sid not in seen and sid not in queued
+                    ]
+                    logger.debug(
+                        f'{series_id=}: {len(sample_ids)} samples, {len(unseen_ids)} unseen'
+                    )
+                    if unseen_ids:
+                        results = await fetch(unseen_ids)
+                        # Failed lookups stay unclaimed, so a later series can retry them
+                        queued.update(
+                            sid for sid, sample in results if not isinstance(sample, Exception)
+                        )
+                        await queue.put((series, results))
+            await queue.put(None)
+
+        async def consume() -> int:
+            cnt = 1
+            while (item := await queue.get()) is not None:
+                series, results = item
+                cnt = await asyncio.to_thread(
+                    store_series, series, results, conn, cnt, seen, download_idat
+                )
+            return cnt
+
+        # A failure in either stage cancels the other
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(produce())
+            consumer = tg.create_task(consume())
+
+    return consumer.result()
+
+
+@app.command()
+def crawl(
+    skip_seen: bool = True,
+    download_idat: bool = False,
+    concurrency: int = 10,
+):
+    conn = db.connect(autocommit=True)
+    seen = db.seen_sample_ids(conn, 'geo') if skip_seen else set()
+    cnt = asyncio.run(crawl_async(conn, seen, download_idat, concurrency))
+    logger.info(f'Crawl complete: {cnt - 1} samples inserted/updated')
 
 
 @app.command()
@@ -472,9 +731,7 @@ def backfill_characteristics(batch_size: int = 500):
     Rows are streamed from the database in batches of --batch-size to avoid
     loading the full result set into memory.
     """
-    import miqa.config as config
-
-    conn = psycopg.connect(config.DATABASE_URL)
+    conn = db.connect()
 
     with conn.cursor(name='backfill_cur') as cur:
         cur.itersize = batch_size
@@ -0,0 +1,454 @@
+"""
+Shared HTTP helpers for the repository crawlers.
+"""
+
+import asyncio
+import atexit
+import hashlib
+import json
+import os
+import tempfile
+import time
+from contextlib import AbstractContextManager
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+from miqa import config
+
+# Upper bound on open connections for one async crawler client, across all hosts.
+MAX_CONNECTIONS = 20
+
+# Connection pool of the shared sync client: total open connections, and how many of them
+# are kept idle between requests.
+MAX_SYNC_CONNECTIONS = 100
+MAX_KEEPALIVE_CONNECTIONS = 32
+
+# Per-request timeout in seconds. Large eSearch/eSummary batches can take a while.
+TIMEOUT = 30
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# Seconds a cached response without validators is reused for, unless its request asks for
+# a different lifetime with cache_ttl().
+CACHE_TTL = 60 * 60
+
+# Retry policy for responses that may succeed later: rate limited (429) or server errors.
+# Connection failures are retried by the underlying transports as well.
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+MAX_RETRIES = 3
+RETRY_BACKOFF = 1.0
+
+# Identify the crawler to NCBI/EBI instead of sending the default python-httpx agent.
+HEADERS = {'User-Agent': 'miqa (https://github.com/pinealan/dna-microarray-db)'}
+
+# Request extensions that keep a request and its response out of the on-disk cache. Cache
+# policy travels in httpx extensions, which transports read but never send over the wire.
+NO_CACHE = {'cache_bypass': True}
+
+
+def async_client(bucket: 'AsyncTokenBucket | None' = None) -> httpx.AsyncClient:
+    """
+    Return an AsyncClient with the connection pool limits and retry policy shared by the
+    crawlers, caching responses when HTTP_CACHE_DIR is configured.
+
+    With a *bucket*, every request attempt that reaches the network, retries included,
+    takes a token from it first. Responses served from the cache are free.
+    """
+    limits = httpx.Limits(
+        max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS
+    )
+    transport: httpx.AsyncBaseTransport = AsyncRetryTransport(
+        httpx.AsyncHTTPTransport(limits=limits, retries=MAX_RETRIES), bucket=bucket
+    )
+    if config.HTTP_CACHE_DIR:
+        transport = AsyncCacheTransport(
+            config.HTTP_CACHE_DIR,
+            transport=transport,
+            ttl=CACHE_TTL,
+        )
+    return httpx.AsyncClient(transport=transport, headers=HEADERS, timeout=TIMEOUT)
+
+
+async def get_text(client: httpx.AsyncClient, url: str, params: dict | None = None) -> str:
+    res = await client.get(url, params=params)
+    res.raise_for_status()
+    return res.text
+
+
+async def get_json(client: httpx.AsyncClient, url: str, params: dict | None = None) -> Any:
+    res = await client.get(url, params=params)
+    res.raise_for_status()
+    return res.json()
+
+
+class AsyncTokenBucket:
+    """
+    Token bucket rate limiter shared by the coroutines of one event loop.
+
+    Holds at most *burst* tokens, refilled at *rate* tokens per second. Each
+    :meth:`acquire` takes one token, waiting for a refill when the bucket is empty.
+    """
+
+    def __init__(self, rate: float, burst: int | None = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# --------------------
+# On-disk response cache
+# --------------------
+
+
+def cache_ttl(seconds: float) -> dict:
+    """Request extensions that keep the response cached for *seconds* instead of CACHE_TTL."""
+    return {'cache_ttl': seconds}
+
+
+class _DiskCache:
+    """
+    Response store shared by the sync and async caching transports.
+
+    Successful responses are kept on disk, keyed by method, URL and body. Entries that
+    carry an ETag or Last-Modified header are revalidated with a conditional request
+    on every use. Entries without validators are reused as-is until they are *ttl*
+    seconds old, or for the lifetime set with the request's :func:`cache_ttl` extension.
+    Requests sent with the NO_CACHE extension bypass the cache, and their responses are
+    streamed through untouched.
+
+    Entries are replaced when refreshed but never removed, so the directory grows with
+    every distinct URL fetched. Clear it out between full crawls.
+    """
+
+    def __init__(self, cache_dir: str | Path, ttl: float = SECONDS_PER_DAY):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+
+    def _bypass(self, request: httpx.Request) -> bool:
+        return request.extensions.get('cache_bypass', False)
+
+    def _ttl(self, request: httpx.Request) -> float:
+        return request.extensions.get('cache_ttl', self.ttl)
+
+    def _key(self, request: httpx.Request) -> str:
+        h = hashlib.sha256(f'{request.method} {request.url}\n'.encode())
+        h.update(request.content)
+        return h.hexdigest()
+
+    def _load(self, key: str) -> tuple[dict, bytes] | None:
+        try:
+            meta, _, body = (self.cache_dir / f'{key}.cache').read_bytes().partition(b'\n')
+            return json.loads(meta), body
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, key: str, meta: dict, body: bytes) -> None:
+        # Meta (one line of JSON) and body share a file that is written aside and renamed
+        # into place, so readers in this or another process only ever see whole entries
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(json.dumps(meta).encode() + b'\n')
+                f.write(body)
+            os.replace(tmp, self.cache_dir / f'{key}.cache')
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+    def _replay(self, request: httpx.Request, meta: dict, body: bytes) -> httpx.Response:
+        return httpx.Response(
+            meta['status_code'],
+            headers=meta['headers'],
+            stream=httpx.ByteStream(body),
+            request=request,
+        )
+
+    def _lookup(
+        self, request: httpx.Request
+    ) -> tuple[str, tuple[dict, bytes] | None, httpx.Response | None]:
+        """
+        Return (key, cached entry, fresh response) for *request*.
+
+        A fresh response means the entry can be served without contacting the origin.
+        Otherwise conditional headers are added to *request* when the entry has
+        validators.
+        """
+        key = self._key(request)
+        if (cached := self._load(key)) is None:
+            return key, None, None
+
+        meta, body = cached
+        headers = httpx.Headers(meta['headers'])
+        etag, last_modified = headers.get('etag'), headers.get('last-modified')
+        if etag is None and last_modified is None:
+            if time.time() - meta['fetched_at'] < self._ttl(request):
+                return key, cached, self._replay(request, meta, body)
+        else:
+            if etag is not None:
+                request.headers['If-None-Match'] = etag
+            if last_modified is not None:
+                request.headers['If-Modified-Since'] = last_modified
+        return key, cached, None
+
+    def _revalidated(
+        self, request: httpx.Request, key: str, cached: tuple[dict, bytes]
+    ) -> httpx.Response:
+        meta, body = cached
+        meta['fetched_at'] = time.time()
+        self._store(key, meta, body)
+        return self._replay(request, meta, body)
+
+    def _save(
+        self, request: httpx.Request, key: str, res: httpx.Response, body: bytes
+    ) -> httpx.Response:
+        meta = {
+            'status_code': res.status_code,
+            'headers': res.headers.multi_items(),
+            'fetched_at': time.time(),
+        }
+        self._store(key, meta, body)
+        return self._replay(request, meta, body)
+
+
+class CacheTransport(_DiskCache, httpx.BaseTransport):
+    """Sync transport that serves responses from a :class:`_DiskCache`."""
+
+    def __init__(
+        self,
+        cache_dir: str | Path,
+        ttl: float = SECONDS_PER_DAY,
+        transport: httpx.BaseTransport | None = None,
+    ):
+        super().__init__(cache_dir, ttl)
+        self.transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if self._bypass(request):
+            return self.transport.handle_request(request)
+        request.read()
+        key, cached, fresh = self._lookup(request)
+        if fresh is not None:
+            return fresh
+
+        res = self.transport.handle_request(request)
+        if res.status_code == 304 and cached is not None:
+            res.close()
+            return self._revalidated(request, key, cached)
+        if res.status_code != 200:
+            return res
+
+        # Keep the raw (still content-encoded) bytes so the stored headers stay valid
+        try:
+            body = b''.join(res.stream)
+        finally:
+            res.close()
+        return self._save(request, key, res, body)
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncCacheTransport(_DiskCache, httpx.AsyncBaseTransport):
+    """Async transport that serves responses from a :class:`_DiskCache`."""
+
+    def __init__(
+        self,
+        cache_dir: str | Path,
+        ttl: float = SECONDS_PER_DAY,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        super().__init__(cache_dir, ttl)
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self._bypass(request):
+            return await self.transport.handle_async_request(request)
+        await request.aread()
+        key, cached, fresh = self._lookup(request)
+        if fresh is not None:
+            return fresh
+
+        res = await self.transport.handle_async_request(request)
+        if res.status_code == 304 and cached is not None:
+            await res.aclose()
+            return self._revalidated(request, key, cached)
+        if res.status_code != 200:
+            return res
+
+        try:
+            body = b''.join([chunk async for chunk in res.stream])
+        finally:
+            await res.aclose()
+        return self._save(request, key, res, body)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+# --------------------
+# Retries
+# --------------------
+
+
+class _Retry:
+    """
+    Retry policy shared by the sync and async retrying transports.
+
+    Responses with a status in RETRY_STATUSES are retried up to *retries* times. The
+    wait honours a Retry-After header given in seconds, and otherwise doubles from
+    *backoff* seconds on each attempt. The last response is returned once retries run out.
+    """
+
+    def __init__(self, retries: int = MAX_RETRIES, backoff: float = RETRY_BACKOFF):
+        self.retries = retries
+        self.backoff = backoff
+
+    def _delay(self, res: httpx.Response, attempt: int) -> float | None:
+        """Seconds to wait before retrying *res*, or None when it should be returned."""
+        if res.status_code not in RETRY_STATUSES or attempt >= self.retries:
+            return None
+        retry_after = res.headers.get('retry-after', '')
+        if retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff * 2**attempt
+
+
+class RetryTransport(_Retry, httpx.BaseTransport):
+    """Sync transport that retries rate limited and failed requests, see :class:`_Retry`."""
+
+    def __init__(
+        self,
+        transport: httpx.BaseTransport,
+        retries: int = MAX_RETRIES,
+        backoff: float = RETRY_BACKOFF,
+    ):
+        super().__init__(retries, backoff)
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        attempt = 0
+        while True:
+            res = self.transport.handle_request(request)
+            if (delay := self._delay(res, attempt)) is None:
+                return res
+            res.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncRetryTransport(_Retry, httpx.AsyncBaseTransport):
+    """
+    Async transport that retries rate limited and failed requests, see :class:`_Retry`.
+
+    Each attempt first takes a token from *bucket*, when given, so retries count against
+    the same rate limit as first tries.
+    """
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        retries: int = MAX_RETRIES,
+        backoff: float = RETRY_BACKOFF,
+        bucket: 'AsyncTokenBucket | None' = None,
+    ):
+        super().__init__(retries, backoff)
+        self.transport = transport
+        self.bucket = bucket
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        attempt = 0
+        while True:
+            if self.bucket is not None:
+                await self.bucket.acquire()
+            res = await self.transport.handle_async_request(request)
+            if (delay := self._delay(res, attempt)) is None:
+                return res
+            await res.aclose()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+# --------------------
+# Shared sync client
+# --------------------
+
+
+def _client() -> httpx.Client:
+    """
+    Build the pooled, retrying sync client, caching responses when HTTP_CACHE_DIR is
+    configured.
+    """
+    limits = httpx.Limits(
+        max_connections=MAX_SYNC_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+    )
+    transport: httpx.BaseTransport = RetryTransport(
+        httpx.HTTPTransport(limits=limits, retries=MAX_RETRIES)
+    )
+    if config.HTTP_CACHE_DIR:
+        transport = CacheTransport(
+            config.HTTP_CACHE_DIR,
+            transport=transport,
+            ttl=CACHE_TTL,
+        )
+    return httpx.Client(transport=transport, headers=HEADERS, timeout=TIMEOUT)
+
+
+# Shared by every sync request so connections to NCBI/EBI are kept alive between calls
+# instead of paying a TCP + TLS handshake per request.
+CLIENT = _client()
+
+
+def get(url: str, params: dict | None = None) -> httpx.Response:
+    return CLIENT.get(url, params=params)
+
+
+def post(url: str, data: dict | None = None) -> httpx.Response:
+    return CLIENT.post(url, data=data)
+
+
+def stream(
+    url: str, params: dict | None = None, extensions: dict | None = None
+) -> AbstractContextManager[httpx.Response]:
+    """GET *url* without reading the body up front, for consuming large responses lazily."""
+    return CLIENT.stream('GET', url, params=params, extensions=extensions)
+
+
+def stream_file(url: str) -> AbstractContextManager[httpx.Response]:
+    """
+    Like :func:`stream`, but past the response cache, so a large file download is only
+    ever held one chunk at a time.
+    """
+    return CLIENT.stream('GET', url, extensions=NO_CACHE)
+
+
+def close():
+    """Close the pooled connections of the shared client. Runs at interpreter exit."""
+    CLIENT.close()
+
+
+atexit.register(close)
@@ -18,15 +18,17 @@ def match_value(src_attr_value: str, pattern: str, rule_type: str) -> bool:
     """
 
     # Make sure this set is in-sync with what's allowed in `rule_type` table in the DB
-    if rule_type == 'verbatim':
-        return True
-    if rule_type == 'exact':
-        return pattern.lower() == src_attr_value.lower()
-    if rule_type == 'substring':
-        return pattern.lower() in src_attr_value.lower()
-    if rule_type == 'regex':
-        return bool(re.search(pattern, src_attr_value, re.IGNORECASE))
-    raise ValueError(f'Unknown rule_type: {rule_type!r}')
+    match rule_type:
+        case 'verbatim':
+            return True
+        case 'exact':
+            return pattern.lower() == src_attr_value.lower()
+        case 'substring':
+            return pattern.lower() in src_attr_value.lower()
+        case 'regex':
+            return bool(re.search(pattern, src_attr_value, re.IGNORECASE))
+        case _:
+            raise ValueError(f'Unknown rule_type: {rule_type!r}')
 
 
 def first_matching_rule(src_attr_value: str, rules: list[dict]) -> dict | None:
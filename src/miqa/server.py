@@ -8,11 +8,10 @@ Run with:
 import json
 import re
 
-import psycopg
 from flask import Flask, jsonify, render_template, request
 
-import miqa.config as config
 import miqa.normalise as norm
+from miqa import db
 
 app = Flask(__name__)
 
@@ -23,7 +22,20 @@ app = Flask(__name__)
 
 
 def get_conn():
-    return psycopg.connect(config.DATABASE_URL)
+    return db.connect()
+
+
+# Columns of the normalisation_rule rows returned by _fetch_rules, in SELECT order
+_RULE_COLS = (
+    'rule_id',
+    'source_attribute',
+    'pattern',
+    'rule_type',
+    'target_attribute',
+    'attribute_value',
+    'priority',
+    'created_at',
+)
 
 
 def _fetch_rules(conn, target: str | None = None) -> list[dict]:
@@ -44,17 +56,7 @@ def _fetch_rules(conn, target: str | None = None) -> list[dict]:
             '  FROM normalisation_rule'
             ' ORDER BY priority DESC, rule_id',
         ).fetchall()
-    cols = [
-        'rule_id',
-        'source_attribute',
-        'pattern',
-        'rule_type',
-        'target_attribute',
-        'attribute_value',
-        'priority',
-        'created_at',
-    ]
-    return [dict(zip(cols, row)) for row in rows]
+    return [dict(zip(_RULE_COLS, row)) for row in rows]
 
 
 def _fetch_all_samples(conn) -> list[dict]:
@@ -195,11 +197,13 @@ def apply_rules():
         rules = _fetch_rules(conn)
         samples = _fetch_all_samples(conn)
         updated = 0
-        for sample in samples:
-            changes = norm.apply_rules_to_sample(sample, rules)
-            if changes:
-                _update_sample(conn, sample['id'], changes)
-                updated += 1
+        # Pipeline the updates so they don't each wait on a round trip
+        with conn.pipeline():
+            for sample in samples:
+                changes = norm.apply_rules_to_sample(sample, rules)
+                if changes:
+                    _update_sample(conn, sample['id'], changes)
+                    updated += 1
     return jsonify({'updated': updated})
 
 
@@ -217,7 +221,11 @@ def _build_preview(
     the list are returned (the *limit* still applies).
     """
     rules = _fetch_rules(conn)
-    source_rules = [r for r in rules if r['source_attribute'] == source_attr]
+    source_rules = sorted(
+        (r for r in rules if r['source_attribute'] == source_attr),
+        key=lambda r: r['priority'],
+        reverse=True,
+    )
 
     id_filter = ' AND repository_sample_id = ANY(%s)' if sample_ids else ''
     id_param = [sample_ids] if sample_ids else []
@@ -233,11 +241,7 @@ def _build_preview(
         sample_id, repo_sample_id, raw_value = row
         if raw_value is None:
             continue
-        matched = None
-        for rule in sorted(source_rules, key=lambda r: r['priority'], reverse=True):
-            if norm.match_value(str(raw_value), rule['pattern'], rule['rule_type']):
-                matched = rule
-                break
+        matched = norm.first_matching_rule(str(raw_value), source_rules)
 
         preview.append(
             {
@@ -400,13 +404,16 @@ def _compute_stats(conn) -> dict:
     }
 
 
+_AGE_NUMBER_RE = re.compile(r'\d+')
+
+
 def _build_age_histogram(age_values: list[str]) -> list[dict]:
     """Bucket age strings into 10-year intervals. Non-numeric values are counted separately."""
     buckets: dict[int, int] = {}
     non_numeric = 0
 
     for val in age_values:
-        m = re.search(r'\d+', val)
+        m = _AGE_NUMBER_RE.search(val)
         if m:
             bucket = (int(m.group()) // 10) * 10
             buckets[bucket] = buckets.get(bucket, 0) + 1
@@ -2,16 +2,31 @@
 S3-compatible storage helpers (targets DigitalOcean Spaces but works with any S3).
 """
 
+from collections.abc import Iterable
+from functools import lru_cache
 from pathlib import Path
 
 import boto3
 from botocore.client import Config
+from botocore.exceptions import ClientError
 
 from miqa import config
 
+MiB = 1024 * 1024
 
+UPLOAD_EXTRA_ARGS = {'ACL': 'public-read'}
+
+# Part size of stream_to_s3 multipart uploads. S3 needs at least 5 MiB for all but the
+# last part, and a streamed upload holds one part in memory.
+STREAM_PART_SIZE = 16 * MiB
+
+
+@lru_cache(maxsize=1)
 def _client():
-    return boto3.client(
+    # Built once and shared: boto3 clients are thread-safe, and this saves re-reading the
+    # credentials and a fresh TLS connection per upload. The client gets its own session,
+    # as the default boto3 session is not safe to share between threads.
+    return boto3.session.Session().client(
         's3',
         endpoint_url=config.S3_ENDPOINT_URL,
         aws_access_key_id=config.S3_KEY,
@@ -23,11 +38,80 @@ def _client():
 def upload_file(local_path: str | Path, s3_key: str) -> str:
     """Upload a local file to S3. Returns the s3_key on success."""
     _client().upload_file(
-        str(local_path), config.S3_BUCKET, s3_key, ExtraArgs={'ACL':'public-read'}
+        str(local_path),
+        config.S3_BUCKET,
+        s3_key,
+        ExtraArgs=UPLOAD_EXTRA_ARGS,
     )
     return s3_key
 
 
+def object_exists(s3_key: str) -> bool:
+    """Check with a HEAD request whether *s3_key* is already stored."""
+    try:
+        _client().head_object(Bucket=config.S3_BUCKET, Key=s3_key)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        raise
+    return True
+
+
+def stream_to_s3(chunks: Iterable[bytes], s3_key: str, part_size: int = STREAM_PART_SIZE) -> str:
+    """
+    Upload a stream of byte chunks to S3, holding about one part in memory at a time.
+
+    A stream that fits in one part is sent with a single PUT. Larger ones go up as a
+    multipart upload, which is aborted if anything fails part way so no orphaned parts
+    are left behind. Returns the s3_key on success.
+    """
+    client = _client()
+    bucket = config.S3_BUCKET
+    buffer = bytearray()
+    upload_id = None
+    parts = []
+
+    def send_part():
+        part_number = len(parts) + 1
+        res = client.upload_part(
+            Bucket=bucket,
+            Key=s3_key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=bytes(buffer),
+        )
+        parts.append({'ETag': res['ETag'], 'PartNumber': part_number})
+        buffer.clear()
+
+    try:
+        for chunk in chunks:
+            buffer += chunk
+            if len(buffer) >= part_size:
+                if upload_id is None:
+                    upload_id = client.create_multipart_upload(
+                        Bucket=bucket, Key=s3_key, **UPLOAD_EXTRA_ARGS
+                    )['UploadId']
+                send_part()
+
+        if upload_id is None:
+            client.put_object(Bucket=bucket, Key=s3_key, Body=bytes(buffer), **UPLOAD_EXTRA_ARGS)
+            return s3_key
+
+        if buffer:
+            send_part()
+        client.complete_multipart_upload(
+            Bucket=bucket,
+            Key=s3_key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': parts},
+        )
+    except BaseException:
+        if upload_id is not None:
+            client.abort_multipart_upload(Bucket=bucket, Key=s3_key, UploadId=upload_id)
+        raise
+    return s3_key
+
+
 def delete_file(s3_key: str) -> None:
     """Delete an object from S3."""
     _client().delete_object(Bucket=config.S3_BUCKET, Key=s3_key)
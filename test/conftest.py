@@ -0,0 +1,7 @@
+import os
+from pathlib import Path
+
+# Cache GEO/Entrez responses across test sessions, so only the first run of the network
+# backed fixtures pays for the round trips. Set before miqa is imported, since the shared
+# HTTP client reads the setting when it is built. An explicit HTTP_CACHE_DIR still wins.
+os.environ.setdefault('HTTP_CACHE_DIR', str(Path(__file__).parent.parent / '.cache' / 'http'))
@@ -2,7 +2,8 @@ from pathlib import Path
 
 import pytest
 
-from miqa.arrayexpress import parse_idf, parse_sdrf
+from miqa import arrayexpress
+from miqa.arrayexpress import parse_idf, parse_sdrf, store_study
 
 FIXTURE_DIR = Path(__file__).parent.parent
 
@@ -404,3 +405,40 @@ class TestEMTAB14823IDF:
 
     def test_comment_accession(self, emtab14823_idf):
         assert emtab14823_idf['comments']['ArrayExpressAccession'] == 'E-MTAB-14823'
+
+
+# ---------------------------------------------------------------------------
+# store_study — one upsert per SDRF source
+# ---------------------------------------------------------------------------
+
+
+class TestStoreStudy:
+    @pytest.fixture
+    def upserted(self, monkeypatch):
+        rows = []
+
+        def upsert_samples(batch, conn):
+            rows.extend(batch)
+            return list(range(len(batch)))
+
+        monkeypatch.setattr(arrayexpress, 'upsert_samples', upsert_samples)
+        return rows
+
+    def test_one_upsert_per_sample(self, upserted):
+        idf = (FIXTURE_DIR / 'E-MTAB-14823.idf.txt').read_text()
+        sdrf = (FIXTURE_DIR / 'E-MTAB-14823.sdrf.txt').read_text()
+        seen = set()
+        cnt = store_study('E-MTAB-14823', idf, sdrf, conn=None, cnt=1, seen=seen)
+
+        # Every DCA_x source is listed twice, once per channel
+        keys = [sample_key for sample_key, _, _ in upserted]
+        assert len(keys) == len(set(keys)) == 10
+        assert cnt == 11
+        assert seen == set(keys)
+
+    def test_seen_samples_skipped(self, upserted):
+        idf = (FIXTURE_DIR / 'E-MTAB-14823.idf.txt').read_text()
+        sdrf = (FIXTURE_DIR / 'E-MTAB-14823.sdrf.txt').read_text()
+        seen = {'E-MTAB-14823/DCA_1'}
+        store_study('E-MTAB-14823', idf, sdrf, conn=None, cnt=1, seen=seen)
+        assert 'E-MTAB-14823/DCA_1' not in [sample_key for sample_key, _, _ in upserted]
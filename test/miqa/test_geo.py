@@ -1,6 +1,25 @@
+import asyncio
+
+import httpx
 import pytest
 
-from miqa.geo import geo_exact_lookup
+from miqa import config, db, geo, http, storage
+from miqa.geo import (
+    E_UTILS_MAX_GET_IDS,
+    E_UTILS_MAX_GET_TERM,
+    GEODataError,
+    crawl_async,
+    download_idats,
+    e_search,
+    e_search_all,
+    e_summary,
+    e_summary_all,
+    geo_exact_lookup,
+    geo_lookup,
+    has_unseen_samples,
+    parse_soft_lines,
+    series_sample_ids,
+)
 
 
 @pytest.fixture(scope='session')
@@ -22,3 +41,287 @@ def test_series(series):
     # TODO preprocess these from list[str] -> str
     assert len(series['overall_design']) > 0
     assert len(series['summary']) > 0
+
+
+# ---------------------------------------------------------------------------
+# parse_soft_lines — offline SOFT parsing
+# ---------------------------------------------------------------------------
+
+SOFT_SERIES_AND_SAMPLE = [
+    '^SERIES = GSE1',
+    '!Series_title = A study',
+    '!Series_sample_id = GSM1',
+    '!Series_sample_id = GSM2',
+    '!Series_sample_id = GSM3',
+    '!Series_summary = ',
+    '^SAMPLE = GSM1',
+    '!Sample_characteristics_ch1 = tissue: blood',
+    '!Sample_supplementary_file = ftp://example.org/GSM1_Grn.idat.gz',
+]
+
+
+class TestParseSoftLines:
+    def test_entities_split_on_header(self):
+        parsed = parse_soft_lines(SOFT_SERIES_AND_SAMPLE)
+        assert [(e['entity_type'], e['entity_id']) for e in parsed] == [
+            ('SERIES', 'GSE1'),
+            ('SAMPLE', 'GSM1'),
+        ]
+
+    def test_entity_prefix_stripped_from_attributes(self):
+        series, sample = parse_soft_lines(SOFT_SERIES_AND_SAMPLE)
+        assert series['title'] == 'A study'
+        assert sample['characteristics_ch1'] == 'tissue: blood'
+        assert sample['supplementary_file'] == 'ftp://example.org/GSM1_Grn.idat.gz'
+
+    def test_repeated_attribute_becomes_list(self):
+        series, _ = parse_soft_lines(SOFT_SERIES_AND_SAMPLE)
+        assert series['sample_id'] == ['GSM1', 'GSM2', 'GSM3']
+
+    def test_empty_value_skipped(self):
+        series, _ = parse_soft_lines(SOFT_SERIES_AND_SAMPLE)
+        assert 'summary' not in series
+
+    def test_value_containing_separator(self):
+        (sample,) = parse_soft_lines(['^SAMPLE = GSM1', '!Sample_title = a = b'])
+        assert sample['title'] == 'a = b'
+
+    def test_blank_and_comment_lines_ignored(self):
+        (sample,) = parse_soft_lines(['^SAMPLE = GSM1', '', '#comment', '!Sample_title = t'])
+        assert sample == {'entity_type': 'SAMPLE', 'entity_id': 'GSM1', 'title': 't'}
+
+    def test_empty_input(self):
+        assert parse_soft_lines([]) == []
+
+
+# ---------------------------------------------------------------------------
+# e_summary — request method by batch size
+# ---------------------------------------------------------------------------
+
+
+@pytest.fixture
+def entrez_requests(monkeypatch):
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        ids = request.url.params.get('id', '').split(',')
+        result = {uid: {'uid': uid} for uid in ids}
+        return httpx.Response(200, json={'result': result, 'esearchresult': {'idlist': []}})
+
+    monkeypatch.setattr(http, 'CLIENT', httpx.Client(transport=httpx.MockTransport(handler)))
+    return requests
+
+
+class TestESummary:
+    def test_small_batch_uses_get(self, entrez_requests):
+        e_summary([1, 2, 3])
+        (request,) = entrez_requests
+        assert request.method == 'GET'
+        assert request.url.params['id'] == '1,2,3'
+
+    def test_identifies_tool(self, entrez_requests, monkeypatch):
+        monkeypatch.setattr(config, 'NCBI_EMAIL', 'dev@example.org')
+        e_summary([1])
+        (request,) = entrez_requests
+        assert request.url.params['tool'] == 'miqa'
+        assert request.url.params['email'] == 'dev@example.org'
+
+    def test_large_batch_uses_post(self, entrez_requests):
+        ids = range(E_UTILS_MAX_GET_IDS + 1)
+        e_summary(ids)
+        (request,) = entrez_requests
+        assert request.method == 'POST'
+        assert 'id' not in request.url.params
+        assert f'id={"%2C".join(map(str, ids))}'.encode() in request.content
+
+
+class TestGeoLookup:
+    def test_record_cached_for_configured_days(self, monkeypatch):
+        requests = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests.append(request)
+            return httpx.Response(200, stream=httpx.ByteStream(b'^SAMPLE = GSM1\n'))
+
+        monkeypatch.setattr(http, 'CLIENT', httpx.Client(transport=httpx.MockTransport(handler)))
+        monkeypatch.setattr(config, 'HTTP_CACHE_TTL_DAYS', 2)
+        assert geo_lookup('GSM1') == [{'entity_type': 'SAMPLE', 'entity_id': 'GSM1'}]
+        assert requests[0].extensions['cache_ttl'] == 172800
+        assert 'cache-control' not in requests[0].headers
+
+
+class TestESearch:
+    def test_short_term_uses_get(self, entrez_requests):
+        e_search(term='idat[suppFile]')
+        (request,) = entrez_requests
+        assert request.method == 'GET'
+        assert request.url.params['term'] == 'idat[suppFile]'
+
+    def test_long_term_uses_post(self, entrez_requests):
+        term = ' OR '.join(['GPL13534[accn]'] * (E_UTILS_MAX_GET_TERM // 10))
+        e_search(term=term)
+        (request,) = entrez_requests
+        assert request.method == 'POST'
+        assert 'term' not in request.url.params
+        assert b'term=GPL13534' in request.content
+
+
+class TestESearchAll:
+    @pytest.fixture
+    def pages(self, monkeypatch):
+        requests = []
+        ids = [str(i) for i in range(5)]
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests.append(request)
+            start = int(request.url.params['retstart'])
+            size = int(request.url.params['retMax'])
+            result = {'count': str(len(ids)), 'idlist': ids[start : start + size]}
+            return httpx.Response(200, json={'esearchresult': result})
+
+        monkeypatch.setattr(http, 'CLIENT', httpx.Client(transport=httpx.MockTransport(handler)))
+        return requests
+
+    def test_pages_by_retstart(self, pages):
+        assert list(e_search_all(page_size=2, term='idat[suppFile]')) == ['0', '1', '2', '3', '4']
+        assert [r.url.params['retstart'] for r in pages] == ['0', '2', '4']
+        for request in pages:
+            assert request.url.params['term'] == 'idat[suppFile]'
+            assert 'usehistory' not in request.url.params
+
+    def test_error_raises(self, monkeypatch):
+        def handler(request: httpx.Request) -> httpx.Response:
+            result = {'ERROR': 'Invalid query_key', 'count': '0'}
+            return httpx.Response(200, json={'esearchresult': result})
+
+        monkeypatch.setattr(http, 'CLIENT', httpx.Client(transport=httpx.MockTransport(handler)))
+        with pytest.raises(GEODataError, match='Invalid query_key'):
+            list(e_search_all(term='idat[suppFile]'))
+
+
+SERIES_SUMMARY = {'accession': 'GSE1', 'samples': [{'accession': 'GSM1'}, {'accession': 'GSM2'}]}
+
+
+class TestESummaryAll:
+    def test_batches_and_preserves_order(self, entrez_requests):
+        records = list(e_summary_all([5, 3, 9, 1, 7], batch_size=2))
+        assert [r['uid'] for r in records] == ['5', '3', '9', '1', '7']
+        assert [r.url.params['id'] for r in entrez_requests] == ['5,3', '9,1', '7']
+
+
+class TestHasUnseenSamples:
+    def test_all_seen(self):
+        assert not has_unseen_samples(SERIES_SUMMARY, {'GSM1', 'GSM2', 'GSM3'})
+
+    def test_some_unseen(self):
+        assert has_unseen_samples(SERIES_SUMMARY, {'GSM1'})
+
+    def test_no_sample_list(self):
+        assert has_unseen_samples({'accession': 'GSE1'}, {'GSM1'})
+
+
+# ---------------------------------------------------------------------------
+# download_idats — idats streamed from GEO into S3
+# ---------------------------------------------------------------------------
+
+IDAT_SAMPLE = {
+    'entity_id': 'GSM1',
+    'series_id': 'GSE1',
+    'supplementary_file': [
+        'ftp://ftp.ncbi.nlm.nih.gov/geo/samples/GSM1nnn/GSM1/suppl/GSM1_Grn.idat.gz',
+        'ftp://ftp.ncbi.nlm.nih.gov/geo/samples/GSM1nnn/GSM1/suppl/GSM1_Red.idat.gz',
+    ],
+}
+
+
+class TestDownloadIdats:
+    def test_transfer_bypasses_http_cache(self, tmp_path, monkeypatch):
+        def origin(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, stream=httpx.ByteStream(request.url.path.encode()))
+
+        # The shared client as built with HTTP_CACHE_DIR set, in front of a mock origin
+        monkeypatch.setattr(config, 'HTTP_CACHE_DIR', str(tmp_path))
+        monkeypatch.setattr(httpx, 'HTTPTransport', lambda **kwargs: httpx.MockTransport(origin))
+        monkeypatch.setattr(http, 'CLIENT', http._client())
+
+        uploads = {}
+        monkeypatch.setattr(storage, 'object_exists', lambda s3_key: False)
+        monkeypatch.setattr(
+            storage,
+            'stream_to_s3',
+            lambda chunks, s3_key: uploads.update({s3_key: b''.join(chunks)}),
+        )
+        monkeypatch.setattr(
+            db, 'insert_idat_files', lambda conn, *, sample_id, files: list(range(len(files)))
+        )
+        monkeypatch.setattr(db, 'mark_idat_uploaded', lambda conn, idat_id, s3_key: None)
+
+        assert download_idats(IDAT_SAMPLE, 1, conn=None)
+        assert uploads == {
+            'geo/GSM1/GSM1_Grn.idat.gz': b'/geo/samples/GSM1nnn/GSM1/suppl/GSM1_Grn.idat.gz',
+            'geo/GSM1/GSM1_Red.idat.gz': b'/geo/samples/GSM1nnn/GSM1/suppl/GSM1_Red.idat.gz',
+        }
+        assert list(tmp_path.iterdir()) == []
+
+
+# ---------------------------------------------------------------------------
+# crawl_async — producer/consumer pipeline
+# ---------------------------------------------------------------------------
+
+# GSE4 has a single sample, which the SOFT parser collapses to a plain string
+SERIES_SAMPLES = {
+    'GSE1': ['GSM1', 'GSM2'],
+    'GSE2': ['GSM2', 'GSM3'],
+    'GSE3': ['GSM1'],
+    'GSE4': 'GSM77',
+}
+
+
+class TestCrawlAsync:
+    @pytest.fixture
+    def crawl(self, monkeypatch):
+        fetched, stored = [], []
+
+        def summaries():
+            for series_id, sample_ids in SERIES_SAMPLES.items():
+                samples = [{'accession': s} for s in series_sample_ids({'sample_id': sample_ids})]
+                yield {'accession': series_id, 'samples': samples}
+
+        async def fetch_records_async(accession_ids, concurrency, client):
+            fetched.extend(accession_ids)
+            return [
+                (aid, {'entity_id': aid, 'sample_id': SERIES_SAMPLES.get(aid, [])})
+                for aid in accession_ids
+            ]
+
+        def store_series(series, results, conn, cnt, seen, download_idat):
+            # Stores nothing into seen, as if every series were still waiting in the queue
+            stored.extend(sample['entity_id'] for _, sample in results)
+            return cnt + len(results)
+
+        monkeypatch.setattr(geo, 'geo_series_summary_iter', summaries)
+        monkeypatch.setattr(geo, 'fetch_records_async', fetch_records_async)
+        monkeypatch.setattr(geo, 'store_series', store_series)
+        return fetched, stored
+
+    def test_overlapping_series_store_samples_once(self, crawl):
+        fetched, stored = crawl
+        cnt = asyncio.run(crawl_async(None, set(), download_idat=False, concurrency=10))
+        assert sorted(stored) == ['GSM1', 'GSM2', 'GSM3', 'GSM77']
+        assert fetched.count('GSM2') == 1
+        assert cnt == 5
+
+    def test_seen_samples_not_fetched(self, crawl):
+        fetched, stored = crawl
+        asyncio.run(crawl_async(None, {'GSM1', 'GSM2'}, download_idat=False, concurrency=10))
+        assert stored == ['GSM3', 'GSM77']
+        assert 'GSE1' not in fetched
+
+    def test_single_sample_series(self, crawl):
+        fetched, stored = crawl
+        asyncio.run(
+            crawl_async(None, {'GSM1', 'GSM2', 'GSM3'}, download_idat=False, concurrency=10)
+        )
+        assert stored == ['GSM77']
+        assert fetched == ['GSE4', 'GSM77']
@@ -0,0 +1,268 @@
+import asyncio
+import gzip
+import time
+
+import httpx
+
+from miqa.http import (
+    NO_CACHE,
+    AsyncCacheTransport,
+    AsyncRetryTransport,
+    AsyncTokenBucket,
+    CacheTransport,
+    RetryTransport,
+    cache_ttl,
+)
+
+
+class _Origin:
+    """Mock origin server that counts requests and honours If-None-Match."""
+
+    def __init__(self, headers=None, content=b'payload'):
+        self.headers = headers or {}
+        self.content = content
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        etag = self.headers.get('etag')
+        if etag is not None and request.headers.get('if-none-match') == etag:
+            return httpx.Response(304)
+        return httpx.Response(200, headers=self.headers, content=self.content)
+
+
+def _client(tmp_path, origin, **kwargs) -> httpx.Client:
+    transport = CacheTransport(tmp_path, transport=httpx.MockTransport(origin), **kwargs)
+    return httpx.Client(transport=transport)
+
+
+class TestCacheTransport:
+    def test_fresh_entry_served_from_disk(self, tmp_path):
+        origin = _Origin()
+        with _client(tmp_path, origin) as client:
+            assert client.get('https://example.org/a').content == b'payload'
+            assert client.get('https://example.org/a').content == b'payload'
+        assert len(origin.requests) == 1
+
+    def test_cache_survives_new_client(self, tmp_path):
+        origin = _Origin()
+        with _client(tmp_path, origin) as client:
+            client.get('https://example.org/a')
+        with _client(tmp_path, origin) as client:
+            assert client.get('https://example.org/a').content == b'payload'
+        assert len(origin.requests) == 1
+
+    def test_expired_entry_refetched(self, tmp_path):
+        origin = _Origin()
+        with _client(tmp_path, origin, ttl=0) as client:
+            client.get('https://example.org/a')
+            client.get('https://example.org/a')
+        assert len(origin.requests) == 2
+
+    def test_request_ttl_overrides_default(self, tmp_path):
+        origin = _Origin()
+        with _client(tmp_path, origin, ttl=0) as client:
+            client.get('https://example.org/a', extensions=cache_ttl(3600))
+            client.get('https://example.org/a', extensions=cache_ttl(3600))
+            client.get('https://example.org/a')
+        assert len(origin.requests) == 2
+
+    def test_key_includes_params_and_body(self, tmp_path):
+        origin = _Origin()
+        with _client(tmp_path, origin) as client:
+            client.get('https://example.org/a', params={'id': 1})
+            client.get('https://example.org/a', params={'id': 2})
+            client.post('https://example.org/a', data={'id': 1})
+            client.post('https://example.org/a', data={'id': 2})
+            client.post('https://example.org/a', data={'id': 2})
+        assert len(origin.requests) == 4
+
+    def test_entry_stored_as_one_file(self, tmp_path):
+        origin = _Origin()
+        with _client(tmp_path, origin, ttl=0) as client:
+            client.get('https://example.org/a')
+            client.get('https://example.org/a')
+        (entry,) = tmp_path.iterdir()
+        assert entry.suffix == '.cache'
+        assert entry.read_bytes().endswith(b'\npayload')
+
+    def test_unreadable_entry_refetched(self, tmp_path):
+        origin = _Origin()
+        with _client(tmp_path, origin) as client:
+            client.get('https://example.org/a')
+            (entry,) = tmp_path.iterdir()
+            entry.write_bytes(b'{"truncated')
+            assert client.get('https://example.org/a').content == b'payload'
+        assert len(origin.requests) == 2
+
+    def test_etag_revalidated(self, tmp_path):
+        origin = _Origin(headers={'etag': '"v1"'})
+        with _client(tmp_path, origin) as client:
+            client.get('https://example.org/a')
+            res = client.get('https://example.org/a')
+        assert res.status_code == 200
+        assert res.content == b'payload'
+        assert len(origin.requests) == 2
+        assert origin.requests[1].headers['if-none-match'] == '"v1"'
+
+    def test_error_response_not_cached(self, tmp_path):
+        calls = []
+
+        def origin(request):
+            calls.append(request)
+            return httpx.Response(503)
+
+        with _client(tmp_path, origin) as client:
+            assert client.get('https://example.org/a').status_code == 503
+            assert client.get('https://example.org/a').status_code == 503
+        assert len(calls) == 2
+
+    def test_no_cache_request_bypasses_cache(self, tmp_path):
+        origin = _Origin()
+        with _client(tmp_path, origin) as client:
+            client.get('https://example.org/a', extensions=NO_CACHE)
+            client.get('https://example.org/a', extensions=NO_CACHE)
+        assert len(origin.requests) == 2
+        assert 'cache-control' not in origin.requests[0].headers
+        assert list(tmp_path.iterdir()) == []
+
+    def test_content_encoded_body_replayed(self, tmp_path):
+        origin = _Origin(headers={'content-encoding': 'gzip'}, content=gzip.compress(b'payload'))
+        with _client(tmp_path, origin) as client:
+            assert client.get('https://example.org/a').content == b'payload'
+            assert client.get('https://example.org/a').content == b'payload'
+        assert len(origin.requests) == 1
+
+
+class TestAsyncCacheTransport:
+    def test_fresh_entry_served_from_disk(self, tmp_path):
+        origin = _Origin()
+
+        async def fetch_twice():
+            transport = AsyncCacheTransport(tmp_path, transport=httpx.MockTransport(origin))
+            async with httpx.AsyncClient(transport=transport) as client:
+                first = await client.get('https://example.org/a')
+                second = await client.get('https://example.org/a')
+            return first.content, second.content
+
+        assert asyncio.run(fetch_twice()) == (b'payload', b'payload')
+        assert len(origin.requests) == 1
+
+    def test_shares_entries_with_sync_transport(self, tmp_path):
+        origin = _Origin()
+        with _client(tmp_path, origin) as client:
+            client.get('https://example.org/a')
+
+        async def fetch():
+            transport = AsyncCacheTransport(tmp_path, transport=httpx.MockTransport(origin))
+            async with httpx.AsyncClient(transport=transport) as client:
+                return (await client.get('https://example.org/a')).content
+
+        assert asyncio.run(fetch()) == b'payload'
+        assert len(origin.requests) == 1
+
+
+class TestAsyncTokenBucket:
+    def test_burst_is_immediate(self):
+        async def take(n):
+            bucket = AsyncTokenBucket(rate=1, burst=5)
+            start = time.monotonic()
+            await asyncio.gather(*[bucket.acquire() for _ in range(n)])
+            return time.monotonic() - start
+
+        assert asyncio.run(take(5)) < 0.5
+
+    def test_waits_for_refill_once_empty(self):
+        async def take(n):
+            bucket = AsyncTokenBucket(rate=20, burst=2)
+            start = time.monotonic()
+            await asyncio.gather(*[bucket.acquire() for _ in range(n)])
+            return time.monotonic() - start
+
+        # 2 tokens up front, then 4 more at 20/s
+        assert asyncio.run(take(6)) >= 0.15
+
+
+class _Flaky:
+    """Mock origin server that answers with *statuses* in turn, then 200."""
+
+    def __init__(self, *statuses, headers=None):
+        self.statuses = list(statuses)
+        self.headers = headers or {}
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if self.statuses:
+            return httpx.Response(self.statuses.pop(0), headers=self.headers)
+        return httpx.Response(200, content=b'ok')
+
+
+def _retry_client(origin, **kwargs) -> httpx.Client:
+    transport = RetryTransport(httpx.MockTransport(origin), backoff=0, **kwargs)
+    return httpx.Client(transport=transport)
+
+
+class TestRetryTransport:
+    def test_retries_server_errors(self):
+        origin = _Flaky(503, 502)
+        with _retry_client(origin) as client:
+            res = client.get('https://example.org/a')
+        assert res.status_code == 200
+        assert len(origin.requests) == 3
+
+    def test_honours_retry_after(self):
+        origin = _Flaky(429, headers={'retry-after': '0'})
+        with _retry_client(origin) as client:
+            assert client.get('https://example.org/a').status_code == 200
+        assert len(origin.requests) == 2
+
+    def test_gives_up_after_max_retries(self):
+        origin = _Flaky(500, 500, 500)
+        with _retry_client(origin, retries=2) as client:
+            assert client.get('https://example.org/a').status_code == 500
+        assert len(origin.requests) == 3
+
+    def test_client_errors_not_retried(self):
+        origin = _Flaky(404)
+        with _retry_client(origin) as client:
+            assert client.get('https://example.org/a').status_code == 404
+        assert len(origin.requests) == 1
+
+    def test_post_body_resent(self):
+        origin = _Flaky(503)
+        with _retry_client(origin) as client:
+            client.post('https://example.org/a', data={'id': '1,2'})
+        assert [r.content for r in origin.requests] == [b'id=1%2C2'] * 2
+
+
+class TestAsyncRetryTransport:
+    def test_retries_server_errors(self):
+        origin = _Flaky(503)
+
+        async def fetch():
+            transport = AsyncRetryTransport(httpx.MockTransport(origin), backoff=0)
+            async with httpx.AsyncClient(transport=transport) as client:
+                return (await client.get('https://example.org/a')).status_code
+
+        assert asyncio.run(fetch()) == 200
+        assert len(origin.requests) == 2
+
+    def test_takes_a_token_per_attempt(self):
+        origin = _Flaky(429, 503)
+
+        class Bucket:
+            acquired = 0
+
+            async def acquire(self):
+                self.acquired += 1
+
+        bucket = Bucket()
+
+        async def fetch():
+            transport = AsyncRetryTransport(httpx.MockTransport(origin), backoff=0, bucket=bucket)
+            async with httpx.AsyncClient(transport=transport) as client:
+                return (await client.get('https://example.org/a')).status_code
+
+        assert asyncio.run(fetch()) == 200
+        assert bucket.acquired == len(origin.requests) == 3
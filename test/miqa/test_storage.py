@@ -0,0 +1,91 @@
+import pytest
+from botocore.exceptions import ClientError
+
+from miqa import storage
+
+
+class _FakeS3:
+    """Records the S3 calls made by the storage helpers."""
+
+    def __init__(self, fail_on_part=None, keys=()):
+        self.calls = []
+        self.fail_on_part = fail_on_part
+        self.keys = set(keys)
+
+    def head_object(self, **kwargs):
+        self.calls.append(('head_object', kwargs))
+        if kwargs['Key'] not in self.keys:
+            raise ClientError({'Error': {'Code': '404'}}, 'HeadObject')
+
+    def put_object(self, **kwargs):
+        self.calls.append(('put_object', kwargs))
+
+    def create_multipart_upload(self, **kwargs):
+        self.calls.append(('create_multipart_upload', kwargs))
+        return {'UploadId': 'upload-1'}
+
+    def upload_part(self, **kwargs):
+        if kwargs['PartNumber'] == self.fail_on_part:
+            raise OSError('connection reset')
+        self.calls.append(('upload_part', kwargs))
+        return {'ETag': f'etag-{kwargs["PartNumber"]}'}
+
+    def complete_multipart_upload(self, **kwargs):
+        self.calls.append(('complete_multipart_upload', kwargs))
+
+    def abort_multipart_upload(self, **kwargs):
+        self.calls.append(('abort_multipart_upload', kwargs))
+
+    def names(self):
+        return [name for name, _ in self.calls]
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    fake = _FakeS3()
+    monkeypatch.setattr(storage, '_client', lambda: fake)
+    return fake
+
+
+class TestStreamToS3:
+    def test_small_stream_single_put(self, s3):
+        storage.stream_to_s3([b'ab', b'cd'], 'geo/GSM1/a.idat', part_size=10)
+        assert s3.names() == ['put_object']
+        assert s3.calls[0][1]['Body'] == b'abcd'
+
+    def test_large_stream_multipart(self, s3):
+        storage.stream_to_s3([b'abcd', b'efgh', b'ij'], 'geo/GSM1/a.idat', part_size=5)
+        assert s3.names() == [
+            'create_multipart_upload',
+            'upload_part',
+            'upload_part',
+            'complete_multipart_upload',
+        ]
+        bodies = [kwargs['Body'] for name, kwargs in s3.calls if name == 'upload_part']
+        assert bodies == [b'abcdefgh', b'ij']
+        assert s3.calls[-1][1]['MultipartUpload'] == {
+            'Parts': [{'ETag': 'etag-1', 'PartNumber': 1}, {'ETag': 'etag-2', 'PartNumber': 2}]
+        }
+
+    def test_failed_part_aborts_upload(self, s3):
+        s3.fail_on_part = 2
+        with pytest.raises(OSError):
+            storage.stream_to_s3([b'abcdef', b'gh'], 'geo/GSM1/a.idat', part_size=5)
+        assert s3.names()[-1] == 'abort_multipart_upload'
+
+
+class TestObjectExists:
+    def test_existing_key(self, s3):
+        s3.keys.add('geo/GSM1/a.idat')
+        assert storage.object_exists('geo/GSM1/a.idat')
+
+    def test_missing_key(self, s3):
+        assert not storage.object_exists('geo/GSM1/b.idat')
+
+    def test_other_errors_raise(self, s3, monkeypatch):
+        def head_object(**kwargs):
+            raise ClientError({'Error': {'Code': '403'}}, 'HeadObject')
+
+        monkeypatch.setattr(s3, 'head_object', head_object)
+        with pytest.raises(ClientError):
+            storage.object_exists('geo/GSM1/a.idat')